@@ -1,17 +1,33 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context, abort
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, update, delete, func, event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateIndex
+from flask_caching import Cache
 from datetime import datetime, timedelta
+from math import ceil
+from functools import wraps
+from collections import OrderedDict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import hashlib
 from dotenv import load_dotenv
+import orjson
 from geopy.geocoders import Nominatim
-import pandas as pd
+from geopy.extra.rate_limiter import RateLimiter
 from reportlab.pdfgen import canvas
-from io import BytesIO
+from io import StringIO
+from tempfile import SpooledTemporaryFile
+import csv
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-import sqlite3
 
 # Load environment variables
 load_dotenv()
@@ -24,10 +40,65 @@ if not OPENWEATHER_API_KEY:
 # Optional API keys
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
 
+class OrjsonProvider(DefaultJSONProvider):
+    # orjson encodes datetimes natively and is several times faster than the stdlib json
+    def _encode(self, obj, indent=False):
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Same contract as DefaultJSONProvider.response, including pretty-printing in debug
+        # mode, but orjson's bytes go straight into the response without a re-encode
+        if args and kwargs:
+            raise TypeError('app.json.response() takes either args or kwargs, not both')
+        obj = args[0] if len(args) == 1 else args or kwargs or None
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._encode(obj, indent) + b'\n', mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///weather.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Request threads per process; gunicorn.conf.py reads the same variable
+REQUEST_THREADS = int(os.getenv('GUNICORN_THREADS', 16))
+# One pooled connection per request thread, since streamed exports hold theirs for the
+# whole response; overflow absorbs extra threads, e.g. under the development server
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': REQUEST_THREADS, 'max_overflow': 10}
 db = SQLAlchemy(app)
+# SimpleCache is per-process; set CACHE_TYPE=RedisCache in production so workers share it
+cache = Cache(app, config={
+    'CACHE_TYPE': os.getenv('CACHE_TYPE', 'SimpleCache'),
+    'CACHE_REDIS_URL': os.getenv('CACHE_REDIS_URL'),
+    'CACHE_DEFAULT_TIMEOUT': 86400
+})
+
+# Shared pool for issuing upstream API calls concurrently. /api/weather fans out three
+# calls per request thread; batch requests can submit up to 40 and queue behind the rest.
+UPSTREAM_WORKERS = REQUEST_THREADS * 3
+executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS)
+
+# Pooled HTTP session so repeat calls to the same host reuse keep-alive connections
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=50, pool_maxsize=UPSTREAM_WORKERS,
+                      max_retries=Retry(total=2, backoff_factor=0.2))
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+# WAL lets readers run alongside the writer, and NORMAL sync skips an fsync per commit.
+# Registered on this app's engine below, and only when it is SQLite.
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
 
 # Database Models
 class WeatherRecord(db.Model):
@@ -40,61 +111,211 @@ class WeatherRecord(db.Model):
     description = db.Column(db.String(100))
     humidity = db.Column(db.Float)
     wind_speed = db.Column(db.Float)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-# Initialize database
+# Columns returned by /api/records; dates are formatted by SQLite, not per row in Python
+RECORD_COLUMNS = (
+    WeatherRecord.id,
+    WeatherRecord.location,
+    func.strftime('%Y-%m-%dT%H:%M:%S', WeatherRecord.date).label('date'),
+    WeatherRecord.temperature,
+    WeatherRecord.description,
+    WeatherRecord.humidity,
+    WeatherRecord.wind_speed
+)
+
+# Initialize database. Every gunicorn worker runs this at import, so each step has to
+# tolerate another worker having just made the same change.
 with app.app_context():
-    db.create_all()
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', set_sqlite_pragma)
+    try:
+        db.create_all()
+    except OperationalError as e:
+        if 'already exists' not in str(e):
+            raise
+    # create_all() skips existing tables, so add indexes introduced since they were created
+    with db.engine.begin() as connection:
+        for index in WeatherRecord.__table__.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+    # Likewise for columns added after the table was created
+    columns = {column['name'] for column in inspect(db.engine).get_columns('weather_record')}
+    if 'updated_at' not in columns:
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text('ALTER TABLE weather_record ADD COLUMN updated_at DATETIME'))
+        except OperationalError as e:
+            if 'duplicate column name' not in str(e):
+                raise
 
 # Helper Functions
+def two_tier_cache(ttl, maxsize=2048):
+    # Per-process LRU in front of the shared cache, so hot keys skip the cache backend
+    # entirely. The shared tier stores each value with the wall-clock time it expires,
+    # and the local copy keeps that deadline, so nothing is served past its TTL.
+    def decorator(func):
+        @cache.memoize(timeout=ttl)
+        @wraps(func)
+        def shared(*args):
+            return time.time() + ttl, func(*args)
+
+        entries = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args):
+            with lock:
+                entry = entries.get(args)
+                if entry is not None and entry[0] > time.time():
+                    entries.move_to_end(args)
+                    return entry[1]
+            entry = shared(*args)
+            if entry[0] <= time.time():
+                # The backend may hold an entry a moment past its deadline; force a refresh
+                cache.delete_memoized(shared, *args)
+                entry = shared(*args)
+            with lock:
+                entries[args] = entry
+                entries.move_to_end(args)
+                if len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return entry[1]
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
 def get_coordinates(location):
-    geolocator = Nominatim(user_agent="weather_app")
-    location = geolocator.geocode(location)
+    # Normalize so "London" and " london " share one cache entry
+    return _geocode(location.strip().lower())
+
+# Nominatim's usage policy allows at most one request per second. The limiter is shared
+# by every thread in this process, so parallel batch geocodes are spaced out; cache hits
+# return before reaching it. Errors are raised rather than swallowed so they aren't cached.
+geolocator = Nominatim(user_agent="weather_app")
+rate_limited_geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1,
+                                   max_retries=0, swallow_exceptions=False)
+
+@two_tier_cache(ttl=86400)
+def _geocode(location):
+    location = rate_limited_geocode(location)
     if location:
         return location.latitude, location.longitude
     return None, None
 
 def get_weather_data(lat, lon):
+    # Round to ~1 km so nearby lookups share a cache entry
+    return _fetch_weather(round(lat, 2), round(lon, 2))
+
+@two_tier_cache(ttl=300)
+def _fetch_weather(lat, lon):
     url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-    response = requests.get(url)
-    return response.json()
+    response = session.get(url, timeout=(3, 10))
+    # Raise on 4xx/5xx so error bodies (e.g. 429 rate limits) are never memoized
+    response.raise_for_status()
+    return orjson.loads(response.content)
 
 def get_forecast_data(lat, lon, days=5):
+    return _fetch_forecast(round(lat, 2), round(lon, 2))
+
+@two_tier_cache(ttl=1800)
+def _fetch_forecast(lat, lon):
     url = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-    response = requests.get(url)
-    return response.json()
+    response = session.get(url, timeout=(3, 10))
+    # Raise on 4xx/5xx so error bodies (e.g. 429 rate limits) are never memoized
+    response.raise_for_status()
+    return orjson.loads(response.content)
 
 def get_google_maps_data(lat, lon, count=5):
     if not GOOGLE_MAPS_API_KEY:
         return None
     
     url = f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={lat},{lon}&radius=5000&key={GOOGLE_MAPS_API_KEY}"
-    response = requests.get(url)
-    data = response.json()
+    response = session.get(url, timeout=(3, 10))
+    data = orjson.loads(response.content)
     
     if 'results' in data:
         return {'results': data['results'][:count]}
     return None
 
-def init_db():
-    conn = sqlite3.connect('weather.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS weather_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            location TEXT,
-            date TEXT,
-            temperature REAL,
-            description TEXT,
-            humidity INTEGER,
-            wind_speed REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+def weather_summary(current_weather):
+    # The subset of an OpenWeather response that is stored on a WeatherRecord
+    return {
+        'temperature': current_weather['main']['temp'],
+        'description': current_weather['weather'][0]['description'],
+        'humidity': current_weather['main']['humidity'],
+        'wind_speed': current_weather['wind']['speed']
+    }
+
+EXPORT_HEADERS = ['Location', 'Date', 'Temperature (°C)', 'Description', 'Humidity (%)', 'Wind Speed (m/s)']
+
+EXPORT_COLUMNS = (
+    WeatherRecord.location,
+    func.strftime('%Y-%m-%d %H:%M:%S', WeatherRecord.date),
+    WeatherRecord.temperature,
+    WeatherRecord.description,
+    WeatherRecord.humidity,
+    WeatherRecord.wind_speed
+)
+
+# Fields a client may change through PUT /api/records/<id>
+EDITABLE_FIELDS = {'location', 'temperature', 'description'}
+
+# Upper bound on locations accepted by /api/weather/batch
+MAX_BATCH_LOCATIONS = 20
+
+# Rows per PDF table; the export is built from many small tables rather than one
+PDF_CHUNK_SIZE = 500
+
+PDF_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.grey),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.whitesmoke),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.white)
+])
+
+def pdf_table(rows):
+    table = Table([EXPORT_HEADERS] + rows, repeatRows=1)
+    table.setStyle(PDF_STYLE)
+    return table
 
-init_db()
+def records_etag():
+    # Changes whenever a record is added, edited or deleted, without reading the rows.
+    # Also returns the record count so callers don't have to query it again.
+    state = db.session.execute(select(
+        func.count(),
+        func.max(WeatherRecord.created_at),
+        func.max(WeatherRecord.updated_at)
+    )).one()
+    return hashlib.md5(str(tuple(state)).encode()).hexdigest(), state[0]
+
+def with_etag(response, tag):
+    # Revalidate on every request: a PUT or DELETE on one record does not invalidate
+    # cached listings, and the ETag check already makes an unchanged poll a cheap 304
+    response.set_etag(tag)
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response
+
+def _flush(buffer):
+    # Return what has been written so far and reset the buffer for the next rows
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return value
 
 # Routes
 @app.route('/')
@@ -108,6 +329,7 @@ def get_weather():
     location = data.get('location')
     forecast_days = int(data.get('forecastDays', 5))
     places_count = int(data.get('placesCount', 5))
+    summary_only = bool(data.get('summary'))
     
     if not location:
         return jsonify({'error': 'Location is required'}), 400
@@ -117,23 +339,30 @@ def get_weather():
         return jsonify({'error': 'Could not find location'}), 404
     
     try:
-        current_weather = get_weather_data(lat, lon)
-        forecast = get_forecast_data(lat, lon, forecast_days)
-        places = get_google_maps_data(lat, lon, places_count)
+        # Summary clients only need the stored fields, so skip forecast and places entirely
+        if summary_only:
+            current_weather = get_weather_data(lat, lon)
+        else:
+            weather_future = executor.submit(get_weather_data, lat, lon)
+            forecast_future = executor.submit(get_forecast_data, lat, lon, forecast_days)
+            places_future = executor.submit(get_google_maps_data, lat, lon, places_count)
+            current_weather = weather_future.result()
+            forecast = forecast_future.result()
+            places = places_future.result()
         
+        summary = weather_summary(current_weather)
         record = WeatherRecord(
             location=location,
             latitude=lat,
             longitude=lon,
             date=datetime.utcnow(),
-            temperature=current_weather['main']['temp'],
-            description=current_weather['weather'][0]['description'],
-            humidity=current_weather['main']['humidity'],
-            wind_speed=current_weather['wind']['speed']
+            **summary
         )
         db.session.add(record)
         db.session.commit()
         
+        if summary_only:
+            return jsonify(summary)
         return jsonify({
             'current': current_weather,
             'forecast': forecast,
@@ -142,92 +371,170 @@ def get_weather():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch():
+    data = request.get_json()
+    locations = data.get('locations')
+    forecast_days = int(data.get('forecastDays', 5))
+    
+    if not isinstance(locations, list) or not locations:
+        return jsonify({'error': 'A list of locations is required'}), 400
+    if not all(isinstance(location, str) and location.strip() for location in locations):
+        return jsonify({'error': 'Locations must be non-empty strings'}), 400
+    if len(locations) > MAX_BATCH_LOCATIONS:
+        return jsonify({'error': f'At most {MAX_BATCH_LOCATIONS} locations per request'}), 400
+    
+    try:
+        # A failure for one location is reported in its own entry, not for the whole batch
+        results = {}
+        found = []
+        geocode_futures = [executor.submit(get_coordinates, location) for location in locations]
+        for location, geocode_future in zip(locations, geocode_futures):
+            try:
+                lat, lon = geocode_future.result()
+            except Exception as e:
+                results[location] = {'error': str(e)}
+                continue
+            if lat and lon:
+                found.append((location, lat, lon))
+            else:
+                results[location] = {'error': 'Could not find location'}
+        
+        # Queue every upstream call before waiting on any of them
+        weather_futures = [executor.submit(get_weather_data, lat, lon) for _, lat, lon in found]
+        forecast_futures = [executor.submit(get_forecast_data, lat, lon, forecast_days)
+                            for _, lat, lon in found]
+        
+        records = []
+        for (location, lat, lon), weather_future, forecast_future in zip(found, weather_futures, forecast_futures):
+            try:
+                current_weather = weather_future.result()
+                summary = weather_summary(current_weather)
+                forecast = forecast_future.result()
+            except Exception as e:
+                results[location] = {'error': str(e)}
+                continue
+            results[location] = {
+                'current': current_weather,
+                'forecast': forecast
+            }
+            records.append({
+                'location': location,
+                'latitude': lat,
+                'longitude': lon,
+                'date': datetime.utcnow(),
+                **summary
+            })
+        
+        # One multi-row insert and a single commit for the whole batch
+        if records:
+            db.session.bulk_insert_mappings(WeatherRecord, records)
+            db.session.commit()
+        
+        return jsonify([
+            results[location] | {'location': location}
+            for location in locations
+        ])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/records', methods=['GET'])
 def get_records():
-    records = WeatherRecord.query.order_by(WeatherRecord.created_at.desc()).all()
-    return jsonify([{
-        'id': record.id,
-        'location': record.location,
-        'date': record.date.isoformat(),
-        'temperature': record.temperature,
-        'description': record.description,
-        'humidity': record.humidity,
-        'wind_speed': record.wind_speed
-    } for record in records])
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    
+    tag, total = records_etag()
+    # If-None-Match uses weak comparison; proxies that compress responses weaken ETags
+    if request.if_none_match.contains_weak(tag):
+        return with_etag(Response(status=304), tag)
+    
+    # Select only the exported columns; rows serialize straight to JSON without ORM objects
+    rows = db.session.execute(
+        select(*RECORD_COLUMNS)
+        .order_by(WeatherRecord.created_at.desc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
+    return with_etag(jsonify({
+        'items': [dict(row._mapping) for row in rows],
+        'page': page,
+        'pages': ceil(total / per_page),
+        'total': total
+    }), tag)
 
 @app.route('/api/records/<int:id>', methods=['PUT'])
 def update_record(id):
-    record = WeatherRecord.query.get_or_404(id)
     data = request.get_json()
+    patch = {key: value for key, value in data.items() if key in EDITABLE_FIELDS}
     
-    if 'location' in data:
-        record.location = data['location']
-    if 'temperature' in data:
-        record.temperature = data['temperature']
-    if 'description' in data:
-        record.description = data['description']
+    if not patch:
+        db.get_or_404(WeatherRecord, id)
+        return jsonify({'message': 'Record updated successfully'})
     
+    # Single UPDATE statement; no SELECT to load the record first
+    result = db.session.execute(
+        update(WeatherRecord).where(WeatherRecord.id == id).values(**patch))
     db.session.commit()
+    if result.rowcount == 0:
+        abort(404)
     return jsonify({'message': 'Record updated successfully'})
 
 @app.route('/api/records/<int:id>', methods=['DELETE'])
 def delete_record(id):
-    record = WeatherRecord.query.get_or_404(id)
-    db.session.delete(record)
+    result = db.session.execute(delete(WeatherRecord).where(WeatherRecord.id == id))
     db.session.commit()
+    if result.rowcount == 0:
+        abort(404)
     return jsonify({'message': 'Record deleted successfully'})
 
 @app.route('/api/export/<format>', methods=['GET'])
 def export_data(format):
-    records = WeatherRecord.query.order_by(WeatherRecord.created_at.desc()).all()
-    data = [{
-        'Location': record.location,
-        'Date': record.date.strftime('%Y-%m-%d %H:%M:%S'),
-        'Temperature (°C)': record.temperature,
-        'Description': record.description,
-        'Humidity (%)': record.humidity,
-        'Wind Speed (m/s)': record.wind_speed
-    } for record in records]
+    if format not in ('json', 'csv', 'pdf'):
+        return jsonify({'error': 'Invalid format'}), 400
+    
+    tag, _ = records_etag()
+    if request.if_none_match.contains_weak(tag):
+        return with_etag(Response(status=304), tag)
+    
+    query = select(*EXPORT_COLUMNS).order_by(WeatherRecord.created_at.desc())
     
     if format == 'json':
-        return jsonify(data)
+        return with_etag(jsonify([dict(zip(EXPORT_HEADERS, row)) for row in db.session.execute(query)]), tag)
     elif format == 'csv':
-        df = pd.DataFrame(data)
-        output = BytesIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        return output.getvalue(), 200, {'Content-Type': 'text/csv'}
-    elif format == 'pdf':
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-        
-        table_data = [list(data[0].keys())] + [list(record.values()) for record in data]
-        table = Table(table_data)
-        
-        style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.grey),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.whitesmoke),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.white)
-        ])
+        def generate():
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_HEADERS)
+            yield _flush(buffer)
+            for row in db.session.execute(query.execution_options(yield_per=1000)):
+                writer.writerow(row)
+                yield _flush(buffer)
         
-        table.setStyle(style)
-        elements.append(table)
-        doc.build(elements)
+        return with_etag(Response(stream_with_context(generate()), mimetype='text/csv'), tag)
+    elif format == 'pdf':
+        def generate():
+            # Spill to disk once the document outgrows 1 MB, then stream it out
+            with SpooledTemporaryFile(max_size=1024 * 1024) as output:
+                doc = SimpleDocTemplate(output, pagesize=letter)
+                elements = []
+                rows = []
+                for row in db.session.execute(query.execution_options(yield_per=PDF_CHUNK_SIZE)):
+                    rows.append(list(row))
+                    if len(rows) == PDF_CHUNK_SIZE:
+                        elements.append(pdf_table(rows))
+                        rows = []
+                if rows or not elements:
+                    elements.append(pdf_table(rows))
+                doc.build(elements)
+                
+                output.seek(0)
+                while True:
+                    block = output.read(64 * 1024)
+                    if not block:
+                        break
+                    yield block
         
-        buffer.seek(0)
-        return buffer.getvalue(), 200, {'Content-Type': 'application/pdf'}
-    else:
-        return jsonify({'error': 'Invalid format'}), 400
+        return with_etag(Response(stream_with_context(generate()), mimetype='application/pdf'), tag)
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,12 @@
+# Gunicorn settings for production: gunicorn app:app
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+
+# Threaded workers release the GIL while blocked on upstream APIs, so each
+# process keeps many requests in flight instead of one per worker
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+timeout = 30